@@ -1,14 +1,48 @@
-import fastapi
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
+from .config import get_settings
+from .cache_utils import close_shared_cache
+from .database import check_db, engine, init_db, warm_up_pool
 from .store import router as store_router
-from .main import app as user_router
+from .main import router as user_router
 from .cart import router as cart_router
 from .order import router as order_router
-from .esewa import router as esewa_router
+from .esewa import esewa_client, router as esewa_router
+from .email_utils import start_mail_worker, stop_mail_worker
+from .security import shutdown_hash_pool
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs in each worker: drop any pooled connections inherited through a
+    # pre-fork import (gunicorn --preload) so no socket is shared between
+    # processes; everything below uses this worker's own pool
+    engine.dispose(close=False)
+    # Create database tables once per worker at startup, not on import
+    if get_settings().auto_create_tables:
+        init_db()
+    else:
+        check_db()
+    warm_up_pool()
+    start_mail_worker()
+    yield
+    await esewa_client.aclose()
+    await close_shared_cache()
+    stop_mail_worker()
+    shutdown_hash_pool()
 
 
 app=FastAPI(
-    title="E-commerce")
+    title="E-commerce",
+    lifespan=lifespan,
+    # orjson (C/Rust) renders every response instead of stdlib json
+    default_response_class=ORJSONResponse)
+
+# Large JSON bodies (order history, catalog lists) compress several-fold;
+# small ones aren't worth the CPU
+app.add_middleware(GZipMiddleware, minimum_size=1024)
     
 
 app.include_router(user_router, prefix="/users", tags=["users"])
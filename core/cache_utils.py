@@ -0,0 +1,153 @@
+import logging
+import math
+import time
+from typing import Optional
+
+from cachetools import TTLCache
+
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+# Shared cache for rendered list bodies, used only when REDIS_URL is set.
+# Each list has a version counter ("<name>:v"); bodies are stored under
+# "<name>:list:<version>", so bumping the counter invalidates every worker
+# at once. Callers re-read the version after rendering and skip the write
+# if it moved, so a body rendered across a write is not cached.
+SHARED_LIST_TTL = 300
+
+redis_client = None
+# Blocking client for callers that run in the threadpool (the auth
+# dependency); same server, its own connection pool
+sync_redis_client = None
+if settings.redis_url:
+    import redis
+    from redis import asyncio as aioredis
+    from redis.exceptions import RedisError
+
+    redis_client = aioredis.from_url(settings.redis_url)
+    sync_redis_client = redis.from_url(settings.redis_url)
+else:
+    RedisError = Exception
+
+
+async def get_shared_version(name: str) -> Optional[bytes]:
+    """
+    Current version of list `name`, or None when there is no shared cache
+    (or it is unreachable).
+    """
+    if redis_client is None:
+        return None
+    try:
+        return await redis_client.get(f"{name}:v") or b"0"
+    except RedisError:
+        logger.warning("Shared cache read failed for %s", name, exc_info=True)
+        return None
+
+
+async def get_shared_list(name: str, version: Optional[bytes]) -> Optional[bytes]:
+    if redis_client is None or version is None:
+        return None
+    try:
+        return await redis_client.get(f"{name}:list:{version.decode()}")
+    except RedisError:
+        logger.warning("Shared cache read failed for %s", name, exc_info=True)
+        return None
+
+
+async def set_shared_list(name: str, version: Optional[bytes], body: bytes):
+    if redis_client is None or version is None:
+        return
+    try:
+        await redis_client.set(
+            f"{name}:list:{version.decode()}", body, ex=SHARED_LIST_TTL
+        )
+    except RedisError:
+        logger.warning("Shared cache write failed for %s", name, exc_info=True)
+
+
+async def bump_shared_list(*names: str):
+    if redis_client is None:
+        return
+    try:
+        for name in names:
+            await redis_client.incr(f"{name}:v")
+    except RedisError:
+        logger.warning("Shared cache invalidation failed for %s", names, exc_info=True)
+
+
+def revoke_shared(jti: str, exp: float):
+    """
+    Mark token id `jti` as revoked for every worker until `exp` (a POSIX
+    timestamp). Blocking: call it from the threadpool.
+    """
+    if sync_redis_client is None:
+        return
+    ttl = None if exp == math.inf else math.ceil(exp - time.time())
+    if ttl is not None and ttl <= 0:
+        return
+    try:
+        sync_redis_client.set(f"revoked:{jti}", 1, ex=ttl)
+    except RedisError:
+        logger.warning("Shared revocation write failed", exc_info=True)
+
+
+def is_revoked_shared(jti: str) -> bool:
+    """
+    Whether another worker revoked `jti`. False when there is no shared
+    cache (or it is unreachable). Blocking: call it from the threadpool.
+    """
+    if sync_redis_client is None:
+        return False
+    try:
+        return bool(sync_redis_client.exists(f"revoked:{jti}"))
+    except RedisError:
+        logger.warning("Shared revocation read failed", exc_info=True)
+        return False
+
+
+# OTP guesses per email, counted across all workers in Redis (or per worker
+# without it). A 6-digit code allows only OTP_MAX_ATTEMPTS tries per OTP,
+# or per OTP_ATTEMPT_WINDOW (the OTP lifetime), whichever ends first.
+OTP_MAX_ATTEMPTS = 5
+OTP_ATTEMPT_WINDOW = 600
+_otp_attempts = TTLCache(maxsize=10_000, ttl=OTP_ATTEMPT_WINDOW)
+
+
+async def count_otp_attempt(email: str) -> int:
+    """
+    Record one OTP attempt for `email` and return how many were made in
+    the current window, this one included.
+    """
+    if redis_client is not None:
+        key = f"otp-attempts:{email}"
+        try:
+            attempts = await redis_client.incr(key)
+            if attempts == 1:
+                await redis_client.expire(key, OTP_ATTEMPT_WINDOW)
+            return attempts
+        except RedisError:
+            logger.warning("Shared OTP attempt count failed", exc_info=True)
+    _otp_attempts[email] = _otp_attempts.get(email, 0) + 1
+    return _otp_attempts[email]
+
+
+async def reset_otp_attempts(email: str):
+    """
+    Start counting again (a new OTP was issued, or one was used).
+    """
+    _otp_attempts.pop(email, None)
+    if redis_client is None:
+        return
+    try:
+        await redis_client.delete(f"otp-attempts:{email}")
+    except RedisError:
+        logger.warning("Shared OTP attempt reset failed", exc_info=True)
+
+
+async def close_shared_cache():
+    if redis_client is not None:
+        await redis_client.aclose()
+        sync_redis_client.close()
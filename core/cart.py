@@ -1,49 +1,108 @@
-from .database import SessionLocal
+from .dependencies import get_db
 from .models import Cart, CartItem, Product
 from .store_schema import (
     CartItemCreate,
     CartItemUpdate,
     CartResponse,
-    ProductOut
 )
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import bindparam, select
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 from sqlalchemy.orm import Session, joinedload
-from typing import List
+from sqlalchemy.orm.attributes import set_committed_value
 
 router = APIRouter(
     prefix="/carts",
 )
 
-# ---------- DB Dependency ----------
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# ---------- Helpers ----------
+
+def upsert_cart_item(db: Session, cart_id: int, product_id: int, qty: int):
+    """
+    Insert a cart item, or add `qty` to the existing row for that product,
+    in one atomic statement where the database has an upsert.
+    """
+    dialect = db.get_bind().dialect.name
+    values = {"cart_id": cart_id, "product_id": product_id, "qty": qty}
+
+    if dialect in ("postgresql", "sqlite"):
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = insert(CartItem).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CartItem.cart_id, CartItem.product_id],
+            set_={"qty": CartItem.qty + stmt.excluded.qty},
+        ).returning(CartItem)
+        return db.scalars(
+            stmt, execution_options={"populate_existing": True}
+        ).one()
+
+    if dialect in ("mysql", "mariadb"):
+        # No RETURNING here → read the row back by its unique key
+        stmt = mysql.insert(CartItem).values(values)
+        db.execute(
+            stmt.on_duplicate_key_update(qty=CartItem.qty + stmt.inserted.qty)
+        )
+        return db.scalars(
+            select(CartItem).where(
+                CartItem.cart_id == cart_id,
+                CartItem.product_id == product_id,
+            ),
+            execution_options={"populate_existing": True},
+        ).one()
+
+    # Anywhere else: lock the existing row, then update it or insert one
+    cart_item = db.scalars(
+        select(CartItem)
+        .where(CartItem.cart_id == cart_id, CartItem.product_id == product_id)
+        .with_for_update(),
+        execution_options={"populate_existing": True},
+    ).first()
+    if cart_item:
+        cart_item.qty += qty
+    else:
+        cart_item = CartItem(**values)
+        db.add(cart_item)
+    db.flush()
+    return cart_item
 
 
+# Built once at import; requests only bind the cart id
+_CART_WITH_ITEMS = (
+    select(Cart)
+    .options(
+        joinedload(Cart.items).joinedload(CartItem.product)
+    )
+    .where(Cart.id == bindparam("cart_id"))
+    .execution_options(populate_existing=True)
+)
+
+
+def load_cart(db: Session, cart_id: int):
+    """
+    Load a cart with its items and their products in a single query,
+    so response serialization never lazy-loads per item.
+    """
+    return (
+        db.execute(_CART_WITH_ITEMS, {"cart_id": cart_id})
+        .unique()
+        .scalar_one_or_none()
+    )
+
 
 # ---------- CART ----------
 
 @router.post("/{customer_id}", response_model=CartResponse, status_code=status.HTTP_201_CREATED)
 def create_cart(customer_id: int, db: Session = Depends(get_db)):
-    cart = Cart(customer_id=customer_id)
+    # items=[] marks the collection as loaded; timestamps come back
+    # with the INSERT (eager_defaults), so no refresh is needed
+    cart = Cart(customer_id=customer_id, items=[])
     db.add(cart)
     db.commit()
-    db.refresh(cart)
     return cart
 
 @router.get("/{cart_id}", response_model=CartResponse)
 def get_cart(cart_id: int, db: Session = Depends(get_db)):
-    cart = (
-        db.query(Cart)
-        .options(
-            joinedload(Cart.items).joinedload(CartItem.product)
-        )
-        .filter(Cart.id == cart_id)
-        .first()
-    )
+    cart = load_cart(db, cart_id)
 
     if not cart:
         raise HTTPException(status_code=404, detail="Cart not found")
@@ -58,38 +117,34 @@ def add_item_to_cart(
     data: CartItemCreate,
     db: Session = Depends(get_db)
 ):
-    if data.qty <= 0:
-        raise HTTPException(status_code=400, detail="Quantity must be greater than zero")
-    # 1️⃣ Validate cart exists
-    cart = db.query(Cart).filter(Cart.id == cart_id).first()
-    if not cart:
+    # 1️⃣ Validate cart exists — items, their products and the requested
+    # product all come back in one round-trip
+    row = (
+        db.query(Cart, Product)
+        .outerjoin(Product, Product.id == data.product_id)
+        .options(
+            joinedload(Cart.items).joinedload(CartItem.product)
+        )
+        .filter(Cart.id == cart_id)
+        .populate_existing()
+        .first()
+    )
+    if not row:
         raise HTTPException(status_code=404, detail="Cart not found")
+    cart, product = row
 
     # 2️⃣ Validate product exists
-    product = db.query(Product).filter(Product.id == data.product_id).first()
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    # 3️⃣ Check if item already in cart
-    cart_item = (
-        db.query(CartItem)
-        .filter(CartItem.cart_id == cart_id, CartItem.product_id == data.product_id)
-        .first()
-    )
-
-    # 4️⃣ Add or increment
-    if cart_item:
-        cart_item.qty += data.qty
-    else:
-        cart_item = CartItem(
-            cart_id=cart_id,
-            product_id=data.product_id,
-            qty=data.qty
-        )
-        db.add(cart_item)
-
+    # 3️⃣ Add or increment atomically: concurrent adds can't lose updates
+    cart_item = upsert_cart_item(db, cart_id, data.product_id, data.qty)
     db.commit()
-    db.refresh(cart)  # refresh cart with updated items
+
+    # Keep the loaded cart in sync → no reload after commit
+    set_committed_value(cart_item, "product", product)
+    if cart_item not in cart.items:
+        set_committed_value(cart, "items", [*cart.items, cart_item])
 
     return cart
 
@@ -105,9 +160,8 @@ def update_cart_item(
 
     cart_item.qty = data.qty
     db.commit()
-    db.refresh(cart_item.cart)
 
-    return cart_item.cart
+    return load_cart(db, cart_item.cart_id)
 
 @router.delete("/items/{item_id}", response_model=CartResponse)
 def remove_cart_item(item_id: int, db: Session = Depends(get_db)):
@@ -115,12 +169,11 @@ def remove_cart_item(item_id: int, db: Session = Depends(get_db)):
     if not cart_item:
         raise HTTPException(status_code=404, detail="Cart item not found")
 
-    cart = cart_item.cart
+    cart_id = cart_item.cart_id
     db.delete(cart_item)
     db.commit()
-    db.refresh(cart)
 
-    return cart
+    return load_cart(db, cart_id)
 
 
 
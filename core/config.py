@@ -0,0 +1,59 @@
+from functools import lru_cache
+from typing import Optional
+
+from dotenv import find_dotenv
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    """
+    Application settings, read once from the environment / .env file.
+    Missing required values fail at startup instead of on first use.
+    """
+
+    model_config = SettingsConfigDict(
+        env_file=find_dotenv() or None,
+        extra="ignore",
+    )
+
+    # Dev convenience: create/migrate tables at each worker's startup. Turn
+    # off where the schema is set up once per deploy (python -m core.migrate)
+    # so workers start without DDL round-trips.
+    auto_create_tables: bool = True
+
+    # Database + connection pool (per worker: pool_size + max_overflow bounds
+    # the connections each process may open, so workers x that must stay
+    # under the server's max_connections; db_pool_warm are opened at startup)
+    database_url: str = "sqlite:///./ecommerce.db"
+    db_pool_size: int = 5
+    db_max_overflow: int = 5
+    db_pool_warm: int = 2
+
+    # Password hashing processes per worker (each Argon2 hash takes ~46 MiB)
+    hash_pool_workers: int = 2
+    db_pool_timeout: int = 30
+    db_pool_recycle: int = 1800
+
+    # JWT
+    secret_key: str
+    algorithm: str
+    access_token_expire_minutes: int
+
+    # Optional shared cache for rendered list responses and revoked tokens
+    # (all workers)
+    redis_url: Optional[str] = None
+
+    # SMTP (only needed when emails are actually sent)
+    email_host_user: Optional[str] = None
+    email_host_password: Optional[str] = None
+
+    # eSewa
+    esewa_merchant_code: Optional[str] = None
+    esewa_secret_key: Optional[str] = None
+    esewa_payment_callback_url: Optional[str] = None
+    esewa_uat_base_url: Optional[str] = None
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    return Settings()
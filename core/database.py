@@ -1,14 +1,39 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, func, inspect, select, text, update
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.schema import CreateIndex
 from sqlalchemy.ext.declarative import declarative_base
 
-# SQLite database URL. The `check_same_thread=False` is crucial for SQLite
-# when used with FastAPI's asynchronous nature to prevent concurrency issues.
-SQLALCHEMY_DATABASE_URL = "sqlite:///./ecommerce.db"
+from .config import get_settings
+
+settings = get_settings()
+
+# Database URL (SQLite by default). The `check_same_thread=False` is crucial
+# for SQLite when used with FastAPI's asynchronous nature to prevent
+# concurrency issues.
+SQLALCHEMY_DATABASE_URL = settings.database_url
 # Create a SQLAlchemy engine
 # echo=True will log all SQL statements, useful for debugging
+# Pool is sized for concurrent requests: connections are reused instead of
+# opened per request, checked with a ping before use and recycled every
+# db_pool_recycle seconds. Bursts may borrow up to db_max_overflow extra
+# connections, waiting at most db_pool_timeout seconds for one. All of it is
+# tunable per deployment (DB_POOL_SIZE, ...) to stay under the server's limit.
+POOL_SIZE = settings.db_pool_size
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}, echo=True
+    SQLALCHEMY_DATABASE_URL,
+    connect_args=(
+        {"check_same_thread": False}
+        if SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+        else {}
+    ),
+    echo=True,
+    poolclass=QueuePool,
+    pool_size=POOL_SIZE,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_pre_ping=True,
+    pool_recycle=settings.db_pool_recycle,
 )
 # Configure a sessionmaker to create new session objects
 # autocommit=False: Changes won't be automatically committed
@@ -16,4 +41,158 @@ engine = create_engine(
 # expire_on_commit=False: Prevents objects from expiring after commit, useful for re-using objects
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=False)
 # Declare a base class for SQLAlchemy models
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
+
+def warm_up_pool():
+    """
+    Open a few connections (db_pool_warm, at most POOL_SIZE) up front so the
+    first requests don't pay the connect cost; the rest open on demand.
+    All are held at once, then returned to the pool.
+    """
+    connections = []
+    try:
+        for _ in range(min(settings.db_pool_warm, POOL_SIZE)):
+            conn = engine.connect()
+            conn.execute(text("SELECT 1"))
+            connections.append(conn)
+    finally:
+        for conn in connections:
+            conn.close()
+
+
+def init_db():
+    """
+    Create any missing tables and bring older ones up to date. Run it once
+    per deploy with `python -m core.migrate`, or at each worker's startup
+    (behind the auto_create_tables setting); never on import. Every step is
+    safe to repeat and indexes are created IF NOT EXISTS, so workers booting
+    together don't collide.
+    """
+    from . import models  # noqa: F401  (registers the tables on Base)
+
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        if not has_index(conn, "users", "ix_users_email_lower"):
+            add_user_email_lower_index(conn)
+        if not cart_items_are_unique(conn):
+            add_cart_item_unique_index(conn)
+
+
+def has_index(conn, table: str, name: str) -> bool:
+    # SQLite's reflection skips expression indexes → ask its catalog directly
+    if conn.dialect.name == "sqlite":
+        return conn.execute(
+            text(
+                "SELECT 1 FROM sqlite_master "
+                "WHERE type = 'index' AND tbl_name = :table AND name = :name"
+            ),
+            {"table": table, "name": name},
+        ).first() is not None
+    return inspect(conn).has_index(table, name)
+
+
+def add_user_email_lower_index(conn):
+    """
+    Migrate a users table created before emails were normalized: lowercase
+    the stored emails, then build the case-insensitive unique index. Accounts
+    that only differ by case can't be merged automatically → refuse to start.
+    """
+    from .models import User
+
+    collisions = conn.execute(
+        select(func.lower(User.email))
+        .group_by(func.lower(User.email))
+        .having(func.count() > 1)
+    ).scalars().all()
+    if collisions:
+        raise RuntimeError(
+            "Cannot lowercase users.email, several accounts share these emails "
+            f"ignoring case: {', '.join(collisions)}. Merge or rename them first."
+        )
+
+    conn.execute(
+        update(User)
+        .where(User.email != func.lower(User.email))
+        .values(email=func.lower(User.email))
+    )
+    conn.execute(
+        CreateIndex(model_index(User, "ix_users_email_lower"), if_not_exists=True)
+    )
+
+
+def model_index(model, name: str):
+    return next(index for index in model.__table__.indexes if index.name == name)
+
+
+def cart_items_are_unique(conn) -> bool:
+    """
+    Whether cart_items has the (cart_id, product_id) uniqueness the cart
+    upsert relies on, either as a unique index or as a table constraint.
+    """
+    inspector = inspect(conn)
+    keys = [
+        index["column_names"]
+        for index in inspector.get_indexes("cart_items")
+        if index["unique"]
+    ]
+    keys += [
+        constraint["column_names"]
+        for constraint in inspector.get_unique_constraints("cart_items")
+    ]
+    return any(set(columns) == {"cart_id", "product_id"} for columns in keys)
+
+
+def add_cart_item_unique_index(conn):
+    """
+    Migrate a cart_items table created before the unique index: fold
+    duplicate (cart_id, product_id) rows into the oldest one, summing
+    their quantities, then build the index.
+    """
+    from .models import CartItem
+
+    duplicates = conn.execute(
+        select(
+            CartItem.cart_id,
+            CartItem.product_id,
+            func.min(CartItem.id),
+            func.sum(CartItem.qty),
+        )
+        .group_by(CartItem.cart_id, CartItem.product_id)
+        .having(func.count() > 1)
+    ).all()
+    for cart_id, product_id, keep_id, qty in duplicates:
+        conn.execute(
+            CartItem.__table__.update()
+            .where(CartItem.id == keep_id)
+            .values(qty=qty)
+        )
+        conn.execute(
+            CartItem.__table__.delete().where(
+                CartItem.cart_id == cart_id,
+                CartItem.product_id == product_id,
+                CartItem.id != keep_id,
+            )
+        )
+
+    conn.execute(
+        CreateIndex(model_index(CartItem, "uq_cart_item_product"), if_not_exists=True)
+    )
+
+
+def check_db():
+    """
+    Fail fast when tables are managed outside the app (auto_create_tables
+    off) but the schema still predates a change the code depends on.
+    """
+    with engine.connect() as conn:
+        if not has_index(conn, "users", "ix_users_email_lower"):
+            raise RuntimeError(
+                "users is missing the ix_users_email_lower unique index; "
+                "run `python -m core.migrate` once"
+            )
+        if not cart_items_are_unique(conn):
+            raise RuntimeError(
+                "cart_items is missing the uq_cart_item_product unique index; "
+                "run `python -m core.migrate` once"
+            )
@@ -1,20 +1,46 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from cachetools import TLRUCache, TTLCache
+import math
+import threading
+import time
 import jwt
-import os
 
-from .models import User
+from .models import Customer, User
+from .cache_utils import is_revoked_shared, revoke_shared
 from .database import SessionLocal
-from dotenv import load_dotenv
+from .config import get_settings
 
-load_dotenv()
+settings = get_settings()
 
-SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = os.getenv("ALGORITHM")
+SECRET_KEY = settings.secret_key
+ALGORITHM = settings.algorithm
 
 security = HTTPBearer(auto_error=False)
 
+# Short-lived caches for the auth hot path (shared by the request threads):
+# token → decoded payload skips jwt.decode, user id → column values of the
+# user and its customer profile skips both SELECTs. Both are per worker:
+# forget_user only clears this worker's copy, so other changes to a user
+# (e.g. is_superuser) can take up to 60s to be seen everywhere. Users
+# without a customer profile are not cached, so a profile created through
+# one worker is seen by all of them right away.
+_token_cache = TTLCache(maxsize=10000, ttl=60)
+_user_cache = TTLCache(maxsize=10000, ttl=60)
+# Token ids (`jti`) revoked by logout, each kept until its token's own
+# `exp` passes. Unbounded on purpose: a full cache would evict (= un-revoke)
+# live tokens, so its size is bounded by the token lifetime instead.
+# Per worker; with REDIS_URL set revocations are also shared through Redis,
+# without it each worker only knows the logouts it handled itself.
+_revoked_tokens = TLRUCache(
+    maxsize=math.inf,
+    ttu=lambda jti, exp, now: exp,
+    timer=time.time,
+)
+_cache_lock = threading.Lock()
+
 
 def get_db():
     db = SessionLocal()
@@ -43,30 +69,52 @@ def get_current_user(
 
     token = credentials.credentials
 
-    # 🔴 STEP 2: Decode JWT
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("user_id")
+    # 🔴 STEP 2: Decode JWT (cached per token)
+    with _cache_lock:
+        payload = _token_cache.get(token)
 
-        if not user_id:
+    if payload is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token expired",
+            )
+        except jwt.InvalidTokenError:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token payload",
+                detail="Invalid token",
             )
 
-    except jwt.ExpiredSignatureError:
+        with _cache_lock:
+            _token_cache[token] = payload
+
+    elif "exp" in payload and payload["exp"] <= time.time():
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token expired",
         )
-    except jwt.InvalidTokenError:
+
+    key = revocation_key(token, payload)
+    with _cache_lock:
+        revoked = key in _revoked_tokens
+
+    if revoked or is_revoked_shared(key):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token revoked",
+        )
+
+    user_id = payload.get("user_id")
+    if not user_id:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token",
+            detail="Invalid token payload",
         )
 
     # 🔴 STEP 3: Load user
-    user = db.query(User).filter(User.id == user_id).first()
+    user = get_cached_user(db, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -76,6 +124,79 @@ def get_current_user(
     return user
 
 
+def _column_values(obj):
+    return {
+        attr.key: getattr(obj, attr.key)
+        for attr in type(obj).__mapper__.column_attrs
+    }
+
+
+def _attach(db: Session, cls, values):
+    obj = cls(**values)
+    make_transient_to_detached(obj)
+    db.add(obj)
+    return obj
+
+
+def get_cached_user(db: Session, user_id: int):
+    """
+    Return the User attached to `db`, served from the user cache when
+    possible. Only column values are cached (the user's and its customer
+    profile's); each request gets its own instances, attached without a
+    SELECT, with `user.customer` already populated so handlers never
+    lazy-load it.
+    """
+    with _cache_lock:
+        values = _user_cache.get(user_id)
+
+    if values is None:
+        user = (
+            db.query(User)
+            .options(joinedload(User.customer))
+            .filter(User.id == user_id)
+            .first()
+        )
+        if user and user.customer:
+            values = (_column_values(user), _column_values(user.customer))
+            with _cache_lock:
+                _user_cache[user_id] = values
+        return user
+
+    user_values, customer_values = values
+    user = _attach(db, User, user_values)
+    set_committed_value(user, "customer", _attach(db, Customer, customer_values))
+    return user
+
+
+def forget_user(user_id: int):
+    """
+    Drop a user's cached values (e.g. after creating its customer profile).
+    """
+    with _cache_lock:
+        _user_cache.pop(user_id, None)
+
+
+def revocation_key(token: str, payload: dict) -> str:
+    # Tokens carry a random `jti`; ones issued before that are keyed whole
+    return payload.get("jti") or token
+
+
+def revoke_token(token: str):
+    """
+    Invalidate a token until it expires (used by logout). Blocking when
+    revocations are shared: call it from the threadpool.
+    """
+    payload = jwt.decode(
+        token, SECRET_KEY, algorithms=[ALGORITHM], options={"verify_exp": False}
+    )
+    key = revocation_key(token, payload)
+    exp = payload.get("exp", math.inf)
+    with _cache_lock:
+        _revoked_tokens[key] = exp
+        _token_cache.pop(token, None)
+    revoke_shared(key, exp)
+
+
 def superuser_required(user: User = Depends(get_current_user)):
     if not user.is_superuser:
         raise HTTPException(403, "Superusers only")
@@ -1,27 +1,95 @@
 from email.message import EmailMessage
+import logging
+import queue
 import smtplib
-import os
-from dotenv import load_dotenv
+import string
+import threading
+from .config import get_settings
 
-load_dotenv()
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
 EMAIL_HOST = "smtp.gmail.com"
 EMAIL_PORT = 587
-EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
-EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD" )  # ⚠️ use env variable in prod
+# Seconds any SMTP socket operation (connect, NOOP, send) may block before
+# failing; a hung server must not stall the single mailer thread forever
+EMAIL_TIMEOUT = 15
+EMAIL_HOST_USER = settings.email_host_user
+EMAIL_HOST_PASSWORD = settings.email_host_password
 
-def send_otp_email(to_email: str, username: str, otp: str):
-    msg = EmailMessage()
-    msg["Subject"] = "Verify your account (OTP)"
-    msg["From"] = EMAIL_HOST_USER
-    msg["To"] = to_email
 
-    msg.set_content(
-        f"""
-Hi {username},
+class SMTPClient:
+    """
+    Long-lived SMTP connection shared by every send in this worker.
+    The TLS + AUTH handshake is paid once and the connection is
+    re-opened lazily when the server drops it (or stops answering).
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        timeout: float = EMAIL_TIMEOUT,
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+        self._smtp = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        smtp.starttls()
+        smtp.login(self.user, self.password)
+        self._smtp = smtp
+
+    def _ensure_connected(self):
+        if self._smtp is None:
+            self._connect()
+            return
+        try:
+            self._smtp.noop()
+        except OSError:  # SMTPException is an OSError too
+            self.close()
+            self._connect()
+
+    def send(self, msg: EmailMessage):
+        with self._lock:
+            self._ensure_connected()
+            try:
+                self._smtp.send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                # Connection died between NOOP and send → retry once
+                self._connect()
+                self._smtp.send_message(msg)
+
+    def close(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except OSError:
+            pass
+        self._smtp = None
+
+
+smtp_client = SMTPClient(EMAIL_HOST, EMAIL_PORT, EMAIL_HOST_USER, EMAIL_HOST_PASSWORD)
+
+
+OTP_SUBJECT = "Verify your account (OTP)"
+
+# Body template built once at import; only the substitution runs per send
+OTP_TEMPLATE = string.Template(
+    """
+Hi $username,
 
 Your OTP for account verification is:
 
-🔐 {otp}
+🔐 $otp
 
 This OTP is valid for 10 minutes.
 
@@ -30,10 +98,64 @@ If you did not request this, ignore this email.
 Thanks,
 Team 🚀
 """
-    )
+)
+
+
+def build_otp_message(to_email: str, username: str, otp: str) -> EmailMessage:
+    msg = EmailMessage()
+    msg["Subject"] = OTP_SUBJECT
+    msg["From"] = EMAIL_HOST_USER
+    msg["To"] = to_email
+    msg.set_content(OTP_TEMPLATE.substitute(username=username, otp=otp))
+    return msg
+
+
+def send_otp_email(to_email: str, username: str, otp: str):
+    smtp_client.send(build_otp_message(to_email, username, otp))
+
+
+# ---------- OTP mail queue ----------
+# Requests only enqueue; a single worker thread owns the shared SMTP
+# session and drains the queue, so API workers never wait on SMTP.
+
+_otp_queue = queue.Queue()
+_mail_worker = None
+
+
+def _drain_otp_queue():
+    while True:
+        job = _otp_queue.get()
+        if job is None:
+            break
+        try:
+            send_otp_email(*job)
+        except Exception:
+            logger.exception("Failed to send OTP email to %s", job[0])
+    smtp_client.close()
+
+
+def start_mail_worker():
+    global _mail_worker
+    if _mail_worker is None or not _mail_worker.is_alive():
+        _mail_worker = threading.Thread(
+            target=_drain_otp_queue, name="otp-mailer", daemon=True
+        )
+        _mail_worker.start()
+
+
+def stop_mail_worker(timeout: float = 10.0):
+    """
+    Send whatever is still queued, then close the SMTP connection.
+    """
+    global _mail_worker
+    if _mail_worker is None:
+        return
+    _otp_queue.put(None)
+    _mail_worker.join(timeout)
+    _mail_worker = None
+
 
-    with smtplib.SMTP(EMAIL_HOST, EMAIL_PORT) as server:
-        server.starttls()
-        server.login(EMAIL_HOST_USER, EMAIL_HOST_PASSWORD)
-        server.send_message(msg)
+def enqueue_otp_email(to_email: str, username: str, otp: str):
+    start_mail_worker()
+    _otp_queue.put_nowait((to_email, username, otp))
 
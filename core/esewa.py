@@ -1,15 +1,19 @@
 # core/esewa.py
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
+from sqlalchemy import func, select, update
 from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
 from decimal import Decimal
-import uuid
-import requests
+import asyncio
+import secrets
+import time
+import httpx
 import logging
 
-from .models import Order, OrderStatusEnum, PaymentModeEnum
+from .models import Order, OrderItem, OrderStatusEnum, PaymentModeEnum
+from .config import get_settings
 from .dependencies import get_db
-import os
 
 router = APIRouter(prefix="/payments/esewa", tags=["eSewa Payments"])
 logger = logging.getLogger(__name__)
@@ -17,10 +21,25 @@ logger = logging.getLogger(__name__)
 # ---------------------------
 # eSewa UAT Credentials
 # ---------------------------
-ESEWA_MERCHANT_CODE = os.getenv("ESEWA_MERCHANT_CODE")
-ESEWA_SECRET_KEY = os.getenv("ESEWA_SECRET_KEY")
-ESEWA_CALLBACK_URL = os.getenv("ESEWA_PAYMENT_CALLBACK_URL")
-ESEWA_UAT_VERIFY_URL = os.getenv("ESEWA_UAT_BASE_URL")
+settings = get_settings()
+ESEWA_MERCHANT_CODE = settings.esewa_merchant_code
+ESEWA_SECRET_KEY = settings.esewa_secret_key
+ESEWA_CALLBACK_URL = settings.esewa_payment_callback_url
+ESEWA_UAT_VERIFY_URL = settings.esewa_uat_base_url
+ESEWA_VERIFY_TIMEOUT = 5.0
+ESEWA_MAX_KEEPALIVE = 32
+ESEWA_CONNECT_RETRIES = 2
+
+# Shared client: keep-alive connections are reused across verifications.
+# Closed by the app lifespan on shutdown.
+esewa_client = httpx.AsyncClient(
+    timeout=ESEWA_VERIFY_TIMEOUT,
+    # Retries only cover failed connects, so a verify is never sent twice
+    transport=httpx.AsyncHTTPTransport(
+        retries=ESEWA_CONNECT_RETRIES,
+        limits=httpx.Limits(max_keepalive_connections=ESEWA_MAX_KEEPALIVE),
+    ),
+)
 
 # ---------------------------
 # Pydantic Schema
@@ -35,20 +54,33 @@ class EsewaPaymentRequest(BaseModel):
 # Utility
 # ---------------------------
 def generate_transaction_uuid() -> str:
-    return str(uuid.uuid4())
+    # UUIDv7-style id: 48-bit ms timestamp + 80 random bits as 32 hex chars.
+    # Time-ordered values append to the transaction_uuid index instead of
+    # splitting random B-tree pages.
+    ts = (time.time_ns() // 1_000_000).to_bytes(6, "big")
+    return (ts + secrets.token_bytes(10)).hex()
+
+def get_order_total(db: Session, order_id: int) -> Decimal:
+    """
+    Sum of price * qty over the order's items, computed in one SQL query
+    instead of lazy-loading every OrderItem.
+    """
+    total = db.scalar(
+        select(func.sum(OrderItem.price * OrderItem.qty))
+        .where(OrderItem.order_id == order_id)
+    )
+    return total if total is not None else Decimal(0)
 
 # ---------------------------
 # Verify payment with eSewa UAT
 # ---------------------------
-def verify_esewa_payment(order: Order) -> bool:
+async def verify_esewa_payment(order: Order, total_amount: Decimal) -> bool:
     """
     Call eSewa UAT verification API to confirm payment.
     """
     if not order.transaction_uuid:
         raise HTTPException(status_code=400, detail="Order has no transaction UUID")
 
-    total_amount = sum(item.price * item.qty for item in order.items)
-
     payload = {
         "amt": str(total_amount),
         "scd": ESEWA_MERCHANT_CODE,
@@ -60,7 +92,14 @@ def verify_esewa_payment(order: Order) -> bool:
     }
 
     logger.info(f"Calling eSewa UAT verify API with payload: {payload}")
-    response = requests.post(ESEWA_UAT_VERIFY_URL, data=payload)
+    try:
+        response = await asyncio.wait_for(
+            esewa_client.post(ESEWA_UAT_VERIFY_URL, data=payload),
+            timeout=ESEWA_VERIFY_TIMEOUT,
+        )
+    except (httpx.HTTPError, asyncio.TimeoutError) as exc:
+        logger.warning(f"eSewa UAT verify call failed: {exc!r}")
+        raise HTTPException(status_code=502, detail="eSewa verification service unavailable")
     logger.info(f"eSewa UAT response: {response.text}")
 
     return response.status_code == 200 and "Success" in response.text
@@ -69,23 +108,24 @@ def verify_esewa_payment(order: Order) -> bool:
 # Endpoint: Initiate payment
 # ---------------------------
 @router.post("/initiate")
-def initiate_esewa_payment(payload: EsewaPaymentRequest, db: Session = Depends(get_db)):
+async def initiate_esewa_payment(payload: EsewaPaymentRequest, db: Session = Depends(get_db)):
     """
     Create transaction UUID for the order (required for eSewa payment)
     """
-    order = db.query(Order).filter(Order.id == payload.order_id).first()
+    order = await run_in_threadpool(
+        lambda: db.get(Order, payload.order_id)
+    )
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     if order.status != OrderStatusEnum.PENDING:
         raise HTTPException(status_code=400, detail="Only pending orders can be paid")
 
-    total_amount = sum([item.price * item.qty for item in order.items])
+    total_amount = await run_in_threadpool(get_order_total, db, order.id)
     total_amount += payload.tax_amount + payload.product_service_charge + payload.product_delivery_charge
 
     # Generate and store transaction UUID
     order.transaction_uuid = generate_transaction_uuid()
-    db.commit()
-    db.refresh(order)
+    await run_in_threadpool(db.commit)
 
     return {
         "order_id": order.id,
@@ -103,12 +143,14 @@ def initiate_esewa_payment(payload: EsewaPaymentRequest, db: Session = Depends(g
 # Endpoint: Pay backend via real UAT
 # ---------------------------
 @router.post("/pay-backend/{order_id}")
-def pay_order_backend(order_id: int, db: Session = Depends(get_db)):
+async def pay_order_backend(order_id: int, db: Session = Depends(get_db)):
     """
     Verify and pay an order using real eSewa UAT.
     Requires that a payment was actually made in eSewa UAT.
     """
-    order = db.query(Order).filter(Order.id == order_id).first()
+    order = await run_in_threadpool(
+        lambda: db.get(Order, order_id)
+    )
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     if order.is_paid:
@@ -116,23 +158,27 @@ def pay_order_backend(order_id: int, db: Session = Depends(get_db)):
     if not getattr(order, "transaction_uuid", None):
         raise HTTPException(status_code=400, detail="Transaction UUID missing. Initiate payment first.")
 
-    # Verify with eSewa UAT
-    success = verify_esewa_payment(order)
+    total_amount = await run_in_threadpool(get_order_total, db, order.id)
+
+    # Verify with eSewa UAT (awaited, the worker keeps serving meanwhile)
+    success = await verify_esewa_payment(order, total_amount)
     if not success:
         raise HTTPException(status_code=400, detail="Payment verification failed at eSewa UAT")
 
-    # Mark order paid
-    order.is_paid = True
-    order.status = OrderStatusEnum.CONFIRM
-    order.payment_mode = PaymentModeEnum.ESEWA
-    db.commit()
-    db.refresh(order)
+    # Mark order paid (Order.payment_values holds the payment rules)
+    payment = Order.payment_values(PaymentModeEnum.ESEWA)
+
+    def mark_paid():
+        db.execute(update(Order).where(Order.id == order.id).values(**payment))
+        db.commit()
+
+    await run_in_threadpool(mark_paid)
 
     return {
         "message": "Order successfully paid via eSewa UAT",
         "order_id": order.id,
-        "status": order.status,
-        "is_paid": order.is_paid,
+        "status": payment["status"],
+        "is_paid": payment["is_paid"],
         "transaction_uuid": order.transaction_uuid
     }
 
@@ -140,34 +186,39 @@ def pay_order_backend(order_id: int, db: Session = Depends(get_db)):
 # Endpoint: Simulated backend payment (for testing)
 # ---------------------------
 @router.post("/pay-esewa/{order_id}")
-def pay_order_simulated(order_id: int, db: Session = Depends(get_db)):
+async def pay_order_simulated(order_id: int, db: Session = Depends(get_db)):
     """
     Simulate full backend payment without calling eSewa.
     Useful for testing and backend-only workflow.
     """
-    order = db.query(Order).filter(Order.id == order_id).first()
+    order = await run_in_threadpool(
+        lambda: db.get(Order, order_id)
+    )
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     if order.is_paid:
         return {"message": "Order already paid", "order_id": order.id}
 
-    # Generate transaction UUID
-    order.transaction_uuid = generate_transaction_uuid()
+    # Generate transaction UUID and mark order paid
+    transaction_uuid = generate_transaction_uuid()
+    payment = Order.payment_values(PaymentModeEnum.ESEWA)
 
-    # Mark order paid
-    order.is_paid = True
-    order.status = OrderStatusEnum.CONFIRM
-    order.payment_mode = PaymentModeEnum.ESEWA
-    db.commit()
-    db.refresh(order)
+    def save_and_total():
+        db.execute(
+            update(Order)
+            .where(Order.id == order.id)
+            .values(transaction_uuid=transaction_uuid, **payment)
+        )
+        db.commit()
+        return get_order_total(db, order.id)
 
-    total_amount = sum([item.price * item.qty for item in order.items])
+    total_amount = await run_in_threadpool(save_and_total)
 
     return {
         "message": "Order successfully paid via backend (simulation)",
         "order_id": order.id,
-        "status": order.status,
-        "is_paid": order.is_paid,
-        "transaction_uuid": order.transaction_uuid,
+        "status": payment["status"],
+        "is_paid": payment["is_paid"],
+        "transaction_uuid": transaction_uuid,
         "total_amount": total_amount
     }
\ No newline at end of file
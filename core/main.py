@@ -1,102 +1,146 @@
-from datetime import datetime
-import fastapi
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+
 import jwt
-from fastapi.security import HTTPBearer,HTTPAuthorizationCredentials
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import func, insert, select, update
 from sqlalchemy.orm import Session
 
-from .dependencies import get_current_user,superuser_required
+from .dependencies import forget_user,get_current_user,get_db,revoke_token,security,superuser_required
 from .models import Customer, User
-from .schemas import CustomerCreate, ForgotPasswordRequest, OTPVerify, ResetPasswordOTP, UserCreate, UserLogin,UserOut
-from .security import hash_password,verify_password
-from fastapi import APIRouter,status,HTTPException,Depends, BackgroundTasks
-from typing import List
-from sqlalchemy.orm import Session
-from.database import engine, SessionLocal, Base
-from datetime import datetime, timedelta
-from .email_utils import send_otp_email
-from .otp_utils import generate_otp, otp_expiry
-
-
-from dotenv import load_dotenv
-import os
-
-# Load environment variables from .env file
-load_dotenv()
-
-
-security=HTTPBearer()
-app = APIRouter()
-SECRET_KEY=os.getenv("SECRET_KEY")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(
-    os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES")
-)
-ALGORITHM = os.getenv("ALGORITHM")
-
-
-# Create database tables if they don't exist
-Base.metadata.create_all(bind=engine)
-
-
+from .schemas import CustomerCreate, ForgotPasswordRequest, OTPVerify, ResetPasswordOTP, UserCreate, UserLogin,UserOut,UserPage
+from .security import hash_password,hash_password_async,needs_rehash,verify_password_async
+from fastapi import APIRouter,status,HTTPException,Depends,Query
+from fastapi.concurrency import run_in_threadpool
+import time
+from .cache_utils import OTP_MAX_ATTEMPTS, count_otp_attempt, reset_otp_attempts
+from .email_utils import enqueue_otp_email
+from .otp_utils import generate_otp, is_otp_expired, otp_expiry, otp_matches
+from .config import get_settings
+
+
+settings = get_settings()
+
+router = APIRouter()
+SECRET_KEY = settings.secret_key
+ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
+ALGORITHM = settings.algorithm
+
+
+def update_user(db: Session, user_id: int, **values):
+    """
+    Write user columns with a single UPDATE, without loading the ORM entity.
+    """
+    db.execute(update(User).where(User.id == user_id).values(**values))
+    db.commit()
 
-# Dependency to get a database session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
+async def limit_otp_attempts(email: str):
+    """
+    Count an OTP guess for `email`; past OTP_MAX_ATTEMPTS the code can't be
+    brute-forced any further until a new one is requested.
+    """
+    if await count_otp_attempt(email) > OTP_MAX_ATTEMPTS:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many OTP attempts, request a new OTP",
+        )
 
 
-@app.post("/users/register", status_code=201)
-def register_user(
+@router.post("/users/register", status_code=201)
+async def register_user(
     user_in: UserCreate,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
 ):
-    # check existing user
-    if db.query(User).filter(User.email == user_in.email).first():
+    # check existing user (id only, no entity to hydrate)
+    existing = await run_in_threadpool(
+        lambda: db.scalar(select(User.id).where(User.email == user_in.email))
+    )
+    if existing is not None:
         raise HTTPException(status_code=400, detail="Email already registered")
 
     otp = generate_otp()
+    hashed_password = await hash_password_async(user_in.password)
+
+    # Plain INSERT: nothing is read back, so no refresh round-trip
+    def save_user():
+        db.execute(
+            insert(User).values(
+                username=user_in.username,
+                email=user_in.email,
+                hashed_password=hashed_password,
+                otp_code=otp,
+                otp_expires_at=otp_expiry(),
+                is_verified=False,
+                is_superuser=False,
+            )
+        )
+        db.commit()
 
-    user = User(
-        username=user_in.username,
-        email=user_in.email,
-        hashed_password=hash_password(user_in.password),
-        otp_code=otp,
-        otp_expires_at=otp_expiry(),
-        is_verified=False,
-    )
-
-    db.add(user)
-    db.commit()
-    db.refresh(user)
+    await run_in_threadpool(save_user)
 
-    background_tasks.add_task(send_otp_email, user.email, user.username, otp)
+    await reset_otp_attempts(user_in.email)
+    enqueue_otp_email(user_in.email, user_in.username, otp)
 
     return {"message": "OTP sent to your email"}
 
-@app.get("/users/{user_id}", response_model=UserOut)
-def read_user(user_id: int, db: Session = Depends(get_db),current_user: User = Depends(superuser_required)):
-    user = db.query(User).filter(User.id == user_id).first()
+@router.get("/users/{user_id}", response_model=UserOut)
+async def read_user(user_id: int, db: Session = Depends(get_db),current_user: User = Depends(superuser_required)):
+    # Only the columns UserOut exposes
+    user = await run_in_threadpool(
+        lambda: db.execute(
+            select(User.id, User.username, User.email)
+            .where(User.id == user_id)
+            .limit(1)
+        ).one_or_none()
+    )
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return {"User":user,"Admin": current_user}
+    return user
+
+@router.get("/users/", response_model=UserPage)
+async def list_users(after_id: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=500),db: Session = Depends(get_db),current_user: User = Depends(superuser_required)):
+    # Keyset pagination: seek on the PK index instead of OFFSET scanning,
+    # and fetch only the columns UserOut exposes
+    rows = await run_in_threadpool(
+        lambda: db.execute(
+            select(User.id, User.username, User.email)
+            .where(User.id > after_id)
+            .order_by(User.id)
+            .limit(limit)
+        ).all()
+    )
+    return {"items": rows, "next_after": rows[-1].id if rows else None}
 
-@app.get("/users/", response_model=List[UserOut])
-def list_users(skip: int = 0, limit: int = 100,db: Session = Depends(get_db),current_user: User = Depends(superuser_required)):
-    users = db.query(User).offset(skip).limit(limit).all()
-    return {"User":users,"Admin": current_user}
 
+# Hash checked for unknown usernames so login timing doesn't reveal them
+DUMMY_PASSWORD_HASH = hash_password("dummy-password")
 
-@app.post("/user/login/", status_code=status.HTTP_200_OK)
-def login_user(user_in: UserLogin, db: Session = Depends(get_db)):
 
-    user = db.query(User).filter(User.username == user_in.username).first()
+@router.post("/user/login/", status_code=status.HTTP_200_OK)
+async def login_user(user_in: UserLogin, db: Session = Depends(get_db)):
+
+    # Only the columns login needs → no full ORM entity to build
+    user = await run_in_threadpool(
+        lambda: db.execute(
+            select(
+                User.id,
+                User.username,
+                User.email,
+                User.hashed_password,
+                User.is_verified,
+            ).where(User.username == user_in.username)
+        ).one_or_none()
+    )
 
     # ❌ User not found or password incorrect
-    if not user or not verify_password(user_in.password, user.hashed_password):
+    # (always run one hash check so unknown usernames take as long as wrong passwords)
+    hashed_password = user.hashed_password if user else DUMMY_PASSWORD_HASH
+    password_ok = await verify_password_async(user_in.password, hashed_password)
+    if not user or not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid username or password"
@@ -109,6 +153,11 @@ def login_user(user_in: UserLogin, db: Session = Depends(get_db)):
             detail="Account not verified. Please verify OTP first."
         )
 
+    # 🔁 Lazily migrate old bcrypt hashes to Argon2id
+    if needs_rehash(user.hashed_password):
+        new_hash = await hash_password_async(user_in.password)
+        await run_in_threadpool(update_user, db, user.id, hashed_password=new_hash)
+
     # ✅ User verified → allow login
     access_token = create_access_token(
         data={
@@ -129,30 +178,78 @@ def login_user(user_in: UserLogin, db: Session = Depends(get_db)):
     }
     
     
-def create_access_token(data: dict, expires_delta: timedelta | None = None):
-    to_encode = data.copy()
+def _b64url(raw: bytes) -> bytes:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=")
 
-    expire = datetime.utcnow() + (
-        expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    )
 
-    to_encode.update({"exp": expire})
+# HS256 tokens always carry the same header, and the HMAC key schedule
+# only depends on SECRET_KEY → build both once and reuse them per login
+_HS256_HEADER_B64 = _b64url(b'{"alg":"HS256","typ":"JWT"}')
+_HS256_SIGNER = hmac.new(SECRET_KEY.encode(), digestmod=hashlib.sha256)
+
 
-    token = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+def create_access_token(data: dict, ttl: int = ACCESS_TOKEN_EXPIRE_MINUTES * 60):
+    # `exp` is a POSIX timestamp in the token anyway → compute it directly.
+    # The random `jti` keeps tokens unique (two logins in the same second
+    # would otherwise get identical ones) and is what logout revokes.
+    payload = {**data, "exp": int(time.time()) + ttl, "jti": secrets.token_urlsafe(16)}
+    if ALGORITHM != "HS256":
+        return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
-    return token
+    signing_input = (
+        _HS256_HEADER_B64
+        + b"."
+        + _b64url(json.dumps(payload, separators=(",", ":")).encode())
+    )
+    signer = _HS256_SIGNER.copy()
+    signer.update(signing_input)
+    return (signing_input + b"." + _b64url(signer.digest())).decode()
 
 
-@app.post("/user/logout/", status_code=status.HTTP_200_OK)
-def logout_user():
+@router.post("/user/logout/", status_code=status.HTTP_200_OK)
+async def logout_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    current_user: User = Depends(get_current_user),
+):
+    await run_in_threadpool(revoke_token, credentials.credentials)
     return {"message": "Logout successful"}
     
 
 
 
-@app.put("/users/verify-otp")
-def verify_otp(data: OTPVerify, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == data.email).first()
+@router.put("/users/verify-otp")
+async def verify_otp(data: OTPVerify, db: Session = Depends(get_db)):
+    await limit_otp_attempts(data.email)
+
+    # Happy path: check + clear + verify in one conditional UPDATE
+    def consume_otp():
+        result = db.execute(
+            update(User)
+            .where(
+                User.email == data.email,
+                User.is_verified == False,
+                User.otp_code == data.otp,
+                User.otp_expires_at > func.now(),
+            )
+            .values(is_verified=True, otp_code=None, otp_expires_at=None)
+        )
+        db.commit()
+        return result.rowcount
+
+    if await run_in_threadpool(consume_otp):
+        await reset_otp_attempts(data.email)
+        return {"message": "Account verified successfully 🎉"}
+
+    # Nothing updated → one SELECT to tell the caller why
+    user = await run_in_threadpool(
+        lambda: db.execute(
+            select(
+                User.is_verified,
+                User.otp_code,
+                User.otp_expires_at,
+            ).where(User.email == data.email)
+        ).one_or_none()
+    )
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -160,55 +257,52 @@ def verify_otp(data: OTPVerify, db: Session = Depends(get_db)):
     if user.is_verified:
         return {"message": "Account already verified"}
 
-    if user.otp_code != data.otp:
+    if not otp_matches(user.otp_code, data.otp):
         raise HTTPException(status_code=400, detail="Invalid OTP")
 
-    if user.otp_expires_at < datetime.utcnow():
-        raise HTTPException(status_code=400, detail="OTP expired")
-
-    user.is_verified = True
-    user.otp_code = None
-    user.otp_expires_at = None
-
-    db.commit()
-    db.refresh(user)
-
-    return {"message": "Account verified successfully 🎉"}
+    raise HTTPException(status_code=400, detail="OTP expired")
 
 
-@app.post("/users/forgot-password", status_code=200)
-def forgot_password(
+@router.post("/users/forgot-password", status_code=200)
+async def forgot_password(
     data: ForgotPasswordRequest,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
 ):
-    user = db.query(User).filter(User.email == data.email).first()
+    user = await run_in_threadpool(
+        lambda: db.execute(
+            select(User.id, User.email, User.username)
+            .where(User.email == data.email)
+        ).one_or_none()
+    )
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
     otp = generate_otp()
 
-    user.otp_code = otp
-    user.otp_expires_at = otp_expiry()
-    db.commit()
-
-    background_tasks.add_task(
-        send_otp_email,
-        user.email,
-        user.username,
-        otp
+    await run_in_threadpool(
+        update_user, db, user.id, otp_code=otp, otp_expires_at=otp_expiry()
     )
 
+    await reset_otp_attempts(user.email)
+    enqueue_otp_email(user.email, user.username, otp)
+
     return {"message": "OTP sent to your email for password reset"}
    
 
-@app.post("/users/reset-password", status_code=200)
-def reset_password(
+@router.post("/users/reset-password", status_code=200)
+async def reset_password(
     data: ResetPasswordOTP,
     db: Session = Depends(get_db),
 ):
-    user = db.query(User).filter(User.email == data.email).first()
+    await limit_otp_attempts(data.email)
+
+    user = await run_in_threadpool(
+        lambda: db.execute(
+            select(User.id, User.otp_code, User.otp_expires_at)
+            .where(User.email == data.email)
+        ).one_or_none()
+    )
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -216,31 +310,30 @@ def reset_password(
     if not user.otp_code or not user.otp_expires_at:
         raise HTTPException(status_code=400, detail="OTP not requested")
 
-    if user.otp_code != data.otp:
+    if not otp_matches(user.otp_code, data.otp):
         raise HTTPException(status_code=400, detail="Invalid OTP")
 
-    if user.otp_expires_at < datetime.utcnow():
+    if is_otp_expired(user.otp_expires_at):
         raise HTTPException(status_code=400, detail="OTP expired")
 
-    # ✅ Hash new password (same as registration)
-    user.hashed_password = hash_password(data.new_password)
-
-    # Clear OTP
-    user.otp_code = None
-    user.otp_expires_at = None
-
-    db.commit()
+    # ✅ Hash new password (same as registration) and clear OTP
+    new_hash = await hash_password_async(data.new_password)
+    await run_in_threadpool(
+        update_user, db, user.id,
+        hashed_password=new_hash, otp_code=None, otp_expires_at=None,
+    )
+    await reset_otp_attempts(data.email)
 
     return {"message": "Password reset successfully 🎉"}
 
 
-@app.post("/")
-def create_customer(
+@router.post("/")
+async def create_customer(
     customer_in: CustomerCreate,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user),  # 👈 JWT user
 ):
-    # Prevent duplicate customer profile
+    # Prevent duplicate customer profile (loaded with the user, no SELECT)
     if current_user.customer:
         raise HTTPException(
             status_code=400,
@@ -255,8 +348,11 @@ def create_customer(
         user_id=current_user.id,  # 🔥 AUTO-ASSIGNED HERE
     )
 
-    db.add(customer)
-    db.commit()
-    db.refresh(customer)
+    def save_customer():
+        db.add(customer)
+        db.commit()
+
+    await run_in_threadpool(save_customer)
+    forget_user(current_user.id)
 
     return customer
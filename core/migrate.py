@@ -0,0 +1,15 @@
+"""
+One-off schema setup: create missing tables and migrate older ones.
+
+Run it once per deploy, before starting the workers, and turn
+auto_create_tables off so they only check the schema at startup:
+
+    python -m core.migrate
+"""
+
+from .database import init_db
+
+
+if __name__ == "__main__":
+    init_db()
+    print("✅ Database is up to date")
@@ -21,6 +21,7 @@ from sqlalchemy import (
     Boolean,
     DateTime,
     ForeignKey,
+    Index,
     Text,
     Numeric,
     Enum as SQLEnum
@@ -33,6 +34,9 @@ from enum import Enum
 from .database import Base
 
 
+# 13% VAT as a multiplier, parsed once instead of on every price access
+TAX_MULTIPLIER = Decimal("1.13")
+
 
 # User
 
@@ -55,11 +59,17 @@ class User(Base):
     #email / otp verification
     is_verified = Column(Boolean, default=False)
     otp_code = Column(String, nullable=True)
-    otp_expires_at = Column(DateTime, nullable=True)
+    otp_expires_at = Column(DateTime(timezone=True), nullable=True)
     
     
     is_superuser=Column(Boolean, default=False)
 
+    # Emails are stored lowercased; this also rejects case-only duplicates
+    # left over from before normalization
+    __table_args__ = (
+        Index("ix_users_email_lower", func.lower(email), unique=True),
+    )
+
 
     # One-to-one relationship with Customer
     customer = relationship(
@@ -126,6 +136,8 @@ class Category(Base):
     Product categories (e.g. Electronics, Clothing).
     """
     __tablename__ = "categories"
+    # created_at/updated_at come back via RETURNING on INSERT/UPDATE
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, nullable=False)
@@ -155,6 +167,8 @@ class Product(Base):
     """
 
     __tablename__ = "products"
+    # created_at/updated_at come back via RETURNING on INSERT/UPDATE
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
 
@@ -193,8 +207,7 @@ class Product(Base):
     # Computed property: price including 13% VAT
     @property
     def price_with_tax(self):
-        tax_rate = Decimal("0.13")
-        return self.price + (self.price * tax_rate)
+        return self.price * TAX_MULTIPLIER
 
     def __str__(self):
         return self.name
@@ -209,6 +222,8 @@ class Cart(Base):
     """
     
     __tablename__ = "carts"
+    # Fetch server defaults (created_at/updated_at) via RETURNING on INSERT
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
 
@@ -254,9 +269,6 @@ class Cart(Base):
     def total_price_with_tax(self):
         return sum(item.total_price_with_tax for item in self.items)
 
-    def __str__(self):
-        return str(self.id)
-
 # CartItem
 
 class CartItem(Base):
@@ -283,6 +295,13 @@ class CartItem(Base):
     # Quantity of product in cart
     qty = Column(Integer, nullable=False)
 
+    # One row per product per cart; adding it again upserts the quantity.
+    # A unique index (not a table constraint) so init_db can add it to
+    # existing databases too
+    __table_args__ = (
+        Index("uq_cart_item_product", "cart_id", "product_id", unique=True),
+    )
+
     # Access related product
     product = relationship(
         "Product",
@@ -327,6 +346,8 @@ class Order(Base):
     """
 
     __tablename__ = "orders"
+    # placed_at is a server default → fetch it via RETURNING on INSERT
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
 
@@ -360,6 +381,12 @@ class Order(Base):
     # Payment status flag
     is_paid = Column(Boolean, default=False)
 
+    # "My orders" reads a customer's orders newest first → serve it
+    # straight from this index instead of sorting
+    __table_args__ = (
+        Index("ix_order_customer_placed", customer_id, placed_at.desc()),
+    )
+
     customer = relationship("Customer", back_populates="orders")
 
     # Items purchased in this order
@@ -369,18 +396,23 @@ class Order(Base):
         cascade="all, delete-orphan"
     )
     
-    def apply_payment(self, payment_mode: PaymentModeEnum):
-        self.payment_mode = payment_mode
+    @staticmethod
+    def payment_values(payment_mode: PaymentModeEnum) -> dict:
+        """
+        Column values an order takes when paid with `payment_mode`
+        (usable on an instance or in an UPDATE statement).
+        """
+        values = {"payment_mode": payment_mode}
 
         if payment_mode == PaymentModeEnum.CASH:
             # Cash on delivery
-            self.is_paid = False
-            self.status = OrderStatusEnum.CONFIRM
+            values.update(is_paid=False, status=OrderStatusEnum.CONFIRM)
 
         elif payment_mode == PaymentModeEnum.ESEWA:
             # Online payment
-            self.is_paid = True
-            self.status = OrderStatusEnum.CONFIRM
+            values.update(is_paid=True, status=OrderStatusEnum.CONFIRM)
+
+        return values
 
     def __str__(self):
         return f"Order No {self.id}"
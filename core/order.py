@@ -2,9 +2,11 @@ from typing import List, Optional
 from datetime import datetime
 from decimal import Decimal
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session, selectinload
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.orm import Session, joinedload, selectinload
 from sqlalchemy.exc import SQLAlchemyError
 
 from .models import (
@@ -17,25 +19,12 @@ from .models import (
     PaymentModeEnum,
     User,
 )
-from.database import SessionLocal
-from .dependencies import get_current_user
+from .dependencies import forget_user, get_current_user, get_db
 
 
 router = APIRouter(prefix="/orders")
 
 
-# =====================================================
-# Database Dependency
-# =====================================================
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 # =====================================================
 # Pydantic Schemas
 # =====================================================
@@ -46,8 +35,7 @@ class OrderItemSchema(BaseModel):
     qty: int
     price: Decimal
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class OrderSchema(BaseModel):
@@ -59,8 +47,35 @@ class OrderSchema(BaseModel):
     placed_at: datetime
     items: List[OrderItemSchema]
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
+
+
+# Built once; my_orders dumps straight to JSON bytes with it
+_orders_adapter = TypeAdapter(List[OrderSchema])
+
+
+def order_to_schema(order: Order) -> OrderSchema:
+    """
+    Project a loaded Order onto OrderSchema without validation: the
+    values come straight from typed DB columns, so there's nothing to check.
+    """
+    return OrderSchema.model_construct(
+        id=order.id,
+        status=order.status,
+        payment_mode=order.payment_mode,
+        is_paid=order.is_paid,
+        delivery_address=order.delivery_address,
+        placed_at=order.placed_at,
+        items=[
+            OrderItemSchema.model_construct(
+                id=item.id,
+                product_id=item.product_id,
+                qty=item.qty,
+                price=item.price,
+            )
+            for item in order.items
+        ],
+    )
 
 
 class PlaceOrderSchema(BaseModel):
@@ -75,6 +90,51 @@ class PaymentRequestSchema(BaseModel):
 # Service Logic
 # =====================================================
 
+# Hot queries built once at import with bound parameters, so each request
+# reuses the same statement (and its compiled-cache entry) instead of
+# rebuilding it through the Query API
+
+# A customer's orders, newest first (served by ix_order_customer_placed)
+_ORDERS_BY_CUSTOMER = (
+    select(Order)
+    .options(selectinload(Order.items))
+    .where(Order.customer_id == bindparam("customer_id"))
+    .order_by(Order.placed_at.desc())
+    .limit(bindparam("limit"))
+    .offset(bindparam("offset"))
+)
+
+# Items of the customer's active cart, prices in one IN query
+_ACTIVE_CART_ITEMS = (
+    select(CartItem)
+    .join(Cart)
+    .options(selectinload(CartItem.product))
+    .where(
+        Cart.customer_id == bindparam("customer_id"),
+        Cart.is_active == True,
+    )
+)
+
+
+def load_order(db: Session, order_id: int):
+    """
+    Single order → join its few items in the same query. Looked up by
+    primary key, so an order already in the session costs no query at all.
+    """
+    return db.get(Order, order_id, options=[joinedload(Order.items)])
+
+
+def load_order_state(db: Session, order_id: int, customer_id: int):
+    """
+    Just the status flags of a customer's order (None if it isn't theirs),
+    to explain why a conditional UPDATE matched nothing.
+    """
+    return db.execute(
+        select(Order.status, Order.is_paid)
+        .where(Order.id == order_id, Order.customer_id == customer_id)
+    ).one_or_none()
+
+
 def place_order_service(
     data: PlaceOrderSchema,
     db: Session,
@@ -87,15 +147,9 @@ def place_order_service(
             detail="Customer profile not found"
         )
 
-    cart_items = (
-        db.query(CartItem)
-        .join(Cart)
-        .filter(
-            Cart.customer_id == customer.id,
-            Cart.is_active == True
-        )
-        .all()
-    )
+    cart_items = db.scalars(
+        _ACTIVE_CART_ITEMS, {"customer_id": customer.id}
+    ).all()
 
     if not cart_items:
         raise HTTPException(
@@ -113,24 +167,29 @@ def place_order_service(
         db.add(order)
         db.flush()  # get order.id
 
-        order_items = [
-            OrderItem(
-                order_id=order.id,
-                product_id=item.product_id,
-                qty=item.qty,
-                price=item.product.price,
-            )
-            for item in cart_items
-        ]
-
-        db.bulk_save_objects(order_items)
+        # One multi-row INSERT, no OrderItem objects to build
+        db.execute(
+            insert(OrderItem),
+            [
+                {
+                    "order_id": order.id,
+                    "product_id": item.product_id,
+                    "qty": item.qty,
+                    "price": item.product.price,
+                }
+                for item in cart_items
+            ],
+        )
 
-        # Clear cart
-        for item in cart_items:
-            db.delete(item)
+        # Clear cart (one DELETE for all lines)
+        db.query(CartItem).filter(
+            CartItem.id.in_([item.id for item in cart_items])
+        ).delete(synchronize_session=False)
 
         db.commit()
-        db.refresh(order)
+        # Load the new lines here (worker thread), not lazily while the
+        # response is serialized on the event loop
+        order.items
         return order
 
     except SQLAlchemyError:
@@ -150,45 +209,53 @@ def place_order_service(
     response_model=OrderSchema,
     status_code=status.HTTP_201_CREATED
 )
-def place_order(
+async def place_order(
     data: PlaceOrderSchema,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    return place_order_service(data, db, current_user)
+    return await run_in_threadpool(place_order_service, data, db, current_user)
 
 
-@router.get("", response_model=List[OrderSchema])
-def my_orders(
+@router.get(
+    "",
+    response_model=None,
+    responses={200: {"model": List[OrderSchema]}},
+)
+async def my_orders(
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    # Auto-create customer if missing
-    customer = current_user.customer
-    if not customer:
-        customer = Customer(
-            user_id=current_user.id,
-            first_name=current_user.username,
-            last_name="",
-            shipping_address="Not set"
-        )
-        db.add(customer)
-        db.commit()
-        db.refresh(customer)
-
-    orders = (
-        db.query(Order)
-        .options(selectinload(Order.items))
-        .filter(Order.customer_id == customer.id)
-        .order_by(Order.placed_at.desc())
-        .all()
+    def load_orders():
+        # Auto-create customer if missing
+        customer = current_user.customer
+        if not customer:
+            customer = Customer(
+                user_id=current_user.id,
+                first_name=current_user.username,
+                last_name="",
+                shipping_address="Not set"
+            )
+            db.add(customer)
+            db.commit()
+            forget_user(current_user.id)
+
+        return db.scalars(
+            _ORDERS_BY_CUSTOMER,
+            {"customer_id": customer.id, "limit": limit, "offset": offset},
+        ).all()
+
+    orders = await run_in_threadpool(load_orders)
+    return Response(
+        _orders_adapter.dump_json([order_to_schema(order) for order in orders]),
+        media_type="application/json",
     )
 
-    return orders
-
 
 @router.patch("/{order_id}/cancel", response_model=OrderSchema)
-def cancel_order(
+async def cancel_order(
     order_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
@@ -200,36 +267,39 @@ def cancel_order(
             detail="Customer profile not found"
         )
 
-    order = (
-        db.query(Order)
-        .options(selectinload(Order.items))
-        .filter(
-            Order.id == order_id,
-            Order.customer_id == customer.id
+    # Check + cancel in one conditional UPDATE; a failed attempt reads only
+    # the status to explain why, never the order's items
+    def cancel():
+        result = db.execute(
+            update(Order)
+            .where(
+                Order.id == order_id,
+                Order.customer_id == customer.id,
+                Order.status == OrderStatusEnum.PENDING,
+            )
+            .values(status=OrderStatusEnum.CANCELLED)
         )
-        .first()
-    )
+        db.commit()
+        return result.rowcount
 
-    if not order:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Order not found"
+    if not await run_in_threadpool(cancel):
+        state = await run_in_threadpool(
+            load_order_state, db, order_id, customer.id
         )
-
-    if order.status != "P":
+        if not state:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Order not found"
+            )
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Only pending orders can be cancelled"
         )
 
-    order.status = "C"
-    db.commit()
-    db.refresh(order)
-
-    return order
+    return await run_in_threadpool(load_order, db, order_id)
 
 @router.patch("/{order_id}/pay", response_model=OrderSchema)
-def pay_order(
+async def pay_order(
     order_id: int,
     data: PaymentRequestSchema,
     db: Session = Depends(get_db),
@@ -239,39 +309,46 @@ def pay_order(
     if not customer:
         raise HTTPException(status_code=404, detail="Customer profile not found")
 
-    order = (
-        db.query(Order)
-        .filter(Order.id == order_id, Order.customer_id == customer.id)
-        .first()
-    )
+    # ✅ Single source of truth (Order.payment_values), applied with a
+    # conditional UPDATE; the items are only read once it succeeded
+    def pay():
+        result = db.execute(
+            update(Order)
+            .where(
+                Order.id == order_id,
+                Order.customer_id == customer.id,
+                Order.status == OrderStatusEnum.PENDING,
+                Order.is_paid == False,
+            )
+            .values(**Order.payment_values(data.payment_mode))
+        )
+        db.commit()
+        return result.rowcount
 
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
+    if not await run_in_threadpool(pay):
+        state = await run_in_threadpool(
+            load_order_state, db, order_id, customer.id
+        )
+        if not state:
+            raise HTTPException(status_code=404, detail="Order not found")
 
-    if order.status != OrderStatusEnum.PENDING:
-        raise HTTPException(status_code=400, detail="Only pending orders can be paid")
+        if state.status != OrderStatusEnum.PENDING:
+            raise HTTPException(status_code=400, detail="Only pending orders can be paid")
 
-    if order.is_paid:
         raise HTTPException(status_code=400, detail="Order already paid")
 
-    # ✅ Single source of truth
-    order.apply_payment(data.payment_mode)
-
-    db.commit()
-    db.refresh(order)
-
-    return order
+    return await run_in_threadpool(load_order, db, order_id)
 
 
 @router.patch("/{order_id}/mark-paid", response_model=OrderSchema)
-def mark_order_paid(
+async def mark_order_paid(
     order_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     # ⚠️ Ideally admin-only check here
 
-    order = db.query(Order).filter(Order.id == order_id).first()
+    order = await run_in_threadpool(load_order, db, order_id)
 
     if not order:
         raise HTTPException(
@@ -294,7 +371,6 @@ def mark_order_paid(
     order.is_paid = True
     order.status = OrderStatusEnum.CONFIRM
 
-    db.commit()
-    db.refresh(order)
+    await run_in_threadpool(db.commit)
 
     return order
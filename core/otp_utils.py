@@ -1,8 +1,21 @@
-import random
-from datetime import datetime, timedelta
+import hmac
+import secrets
+from datetime import datetime, timedelta, timezone
 
 def generate_otp():
-    return str(random.randint(100000, 999999))  # 6-digit OTP
+    return f"{secrets.randbelow(1_000_000):06d}"  # 6-digit OTP, leading zeros kept
 
 def otp_expiry():
-    return datetime.utcnow() + timedelta(minutes=10)
+    return datetime.now(timezone.utc) + timedelta(minutes=10)
+
+def is_otp_expired(expires_at: datetime) -> bool:
+    # SQLite returns naive datetimes; they are stored as UTC
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return expires_at < datetime.now(timezone.utc)
+
+def otp_matches(expected: str | None, given: str) -> bool:
+    # Constant-time compare so response timing doesn't leak matching digits
+    if not expected:
+        return False
+    return hmac.compare_digest(expected.encode(), given.encode())
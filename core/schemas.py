@@ -1,11 +1,15 @@
 # app/schemas/user.py
-from typing import Optional
-from pydantic import BaseModel, EmailStr, field_validator,Field
+from typing import Annotated, List, Optional
+from pydantic import AfterValidator, BaseModel, ConfigDict, EmailStr, field_validator,Field
+
+
+# Emails are matched exactly against the stored (lowercased) value
+NormalizedEmail = Annotated[EmailStr, AfterValidator(str.lower)]
 
 
 class UserCreate(BaseModel):
     username: str
-    email: EmailStr
+    email: NormalizedEmail
     password: str
     confirm_password: str
 
@@ -22,24 +26,28 @@ class UserOut(BaseModel):
     username: str
     email: EmailStr
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
         
+class UserPage(BaseModel):
+    items: List[UserOut]
+    next_after: Optional[int] = None
+
+
 class UserLogin(BaseModel):
     username: str
     password: str
     
     
 class OTPVerify(BaseModel):
-    email: EmailStr
+    email: NormalizedEmail
     otp: str
 
 class ForgotPasswordRequest(BaseModel):
-    email: EmailStr
+    email: NormalizedEmail
     
     
 class ResetPasswordOTP(BaseModel):
-    email: EmailStr
+    email: NormalizedEmail
     otp: str = Field(min_length=4, max_length=6)
     new_password: str = Field(min_length=8)
     
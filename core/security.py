@@ -1,9 +1,83 @@
-from passlib.hash import bcrypt
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from passlib.context import CryptContext
+
+from .config import get_settings
+
+# Argon2id for new hashes (OWASP params); bcrypt kept so old hashes still
+# verify and get upgraded on the next successful login.
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__type="ID",
+    argon2__time_cost=3,
+    argon2__memory_cost=46 * 1024,
+    argon2__parallelism=1,
+)
+
+# Hashing is pure CPU → run it in worker processes so it neither holds
+# the GIL nor ties up the request threads. The pool is created on first use
+# in the process that uses it (never at import, so importers that don't hash
+# spawn nothing and a pre-fork import shares no pool with the workers) and
+# shut down from the app lifespan. It is small (hash_pool_workers) since
+# every API worker gets its own, and its processes are spawned, not forked:
+# by then the worker has threads, and forking a threaded process can leave
+# the child deadlocked on a lock some other thread held. (A forkserver
+# would be shared with processes forked later, which then can't wait on
+# its children.) Spawning is paid once per pool process, not per hash.
+_HASH_POOL_CONTEXT = multiprocessing.get_context("spawn")
+_hash_pool_pid = None
+
+
+@lru_cache(maxsize=1)
+def _hash_pool() -> ProcessPoolExecutor:
+    global _hash_pool_pid
+    _hash_pool_pid = os.getpid()
+    return ProcessPoolExecutor(
+        max_workers=get_settings().hash_pool_workers,
+        mp_context=_HASH_POOL_CONTEXT,
+    )
+
+
+def _current_hash_pool() -> ProcessPoolExecutor:
+    # A pool inherited through fork is unusable here → build a fresh one
+    if _hash_pool_pid not in (None, os.getpid()):
+        _hash_pool.cache_clear()
+    return _hash_pool()
+
+
+def shutdown_hash_pool():
+    """
+    Stop this process's hashing workers (if any were started).
+    """
+    if _hash_pool.cache_info().currsize and _hash_pool_pid == os.getpid():
+        _hash_pool().shutdown()
+    _hash_pool.cache_clear()
 
 
 def hash_password(password: str) -> str:
-    return bcrypt.hash(password)
+    return pwd_context.hash(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.verify(plain_password, hashed_password)
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    return pwd_context.needs_update(hashed_password)
+
+
+async def hash_password_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_current_hash_pool(), hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _current_hash_pool(), verify_password, plain_password, hashed_password
+    )
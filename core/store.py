@@ -1,15 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session,joinedload
+import asyncio
+import logging
+
+from cachetools import TTLCache
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
 from typing import List
 
-from core.dependencies import get_current_user,superuser_required
+from core.dependencies import get_db,superuser_required
 
+from .cache_utils import (
+    bump_shared_list,
+    get_shared_list,
+    get_shared_version,
+    set_shared_list,
+)
 from .database import SessionLocal
-from .models import Cart, CartItem, Category, Product, User
+from .models import TAX_MULTIPLIER, Category, Product, User
 from .store_schema import (
-    CartItemCreate,
-    CartItemUpdate,
-    CartResponse,
     CategoryCreate,
     CategoryOut,
     ProductCreate,
@@ -17,40 +29,229 @@ from .store_schema import (
     ProductOut
 )
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
+# List responses are dumped straight to JSON bytes by pydantic-core with
+# adapters built once at import
+_categories_adapter = TypeAdapter(List[CategoryOut])
+_products_adapter = TypeAdapter(List[ProductOut])
+
+# Rendered list bodies keyed by (list name, shared version), dropped on
+# every write from this worker. Without a shared cache the version is always
+# None and other workers' copies expire within the TTL; with one (REDIS_URL)
+# a write bumps the version, so every worker misses right away, and a body
+# rendered while the version changed is never stored.
+_list_cache = TTLCache(maxsize=8, ttl=30)
+# One lock per list so a burst of misses renders it once, not once per request
+_list_locks = {"categories": asyncio.Lock(), "products": asyncio.Lock()}
+# Bumped on every local invalidation: a render that started before a write
+# sees a different generation when it finishes and doesn't cache its body
+_list_generations = {"categories": 0, "products": 0}
+
+
+async def invalidate_lists(*keys: str):
+    for key in keys:
+        _list_generations[key] += 1
+    for cached in list(_list_cache):
+        if cached[0] in keys:
+            _list_cache.pop(cached, None)
+    await bump_shared_list(*keys)
+
+
+async def cached_list(key: str, render) -> Response:
+    """
+    Serve the JSON body cached under `key` (locally, then in the shared
+    cache), rendering it with `render` (run in the threadpool) on a miss.
+    """
+    generation = _list_generations[key]
+    version = await get_shared_version(key)
+    body = _list_cache.get((key, version))
+    if body is None:
+        async with _list_locks[key]:
+            # Another request may have filled it while we waited
+            body = _list_cache.get((key, version))
+            if body is None:
+                body = await get_shared_list(key, version)
+                if body is not None:
+                    _list_cache[(key, version)] = body
+                else:
+                    body = await run_in_threadpool(render)
+                    # Invalidated meanwhile, here or by another worker →
+                    # serve this body, but don't keep it anywhere
+                    if (
+                        _list_generations[key] == generation
+                        and await get_shared_version(key) == version
+                    ):
+                        await set_shared_list(key, version, body)
+                        _list_cache[(key, version)] = body
+    return Response(body, media_type="application/json")
+
+
+# List rows come straight from typed DB columns, so they are projected onto
+# the output schemas with model_construct (no validation) before dumping.
+# They are plain column rows (no ORM entities), selected by the lists below.
+
+_CATEGORY_COLUMNS = (
+    Category.id,
+    Category.name,
+    Category.created_at,
+    Category.updated_at,
+)
+_PRODUCT_COLUMNS = (
+    Product.id,
+    Product.name,
+    Product.stock_qty,
+    Product.price,
+    Product.category_id,
+    Product.created_at,
+    Product.updated_at,
+)
+
+
+def category_names(db: Session, category_ids) -> dict:
+    """
+    id → name for the given categories in one IN query, so products can
+    carry their category name without a join or a per-row lookup.
+    """
+    return dict(
+        db.execute(
+            select(Category.id, Category.name)
+            .where(Category.id.in_(set(category_ids)))
+        ).all()
+    )
+
+
+def category_to_schema(category) -> CategoryOut:
+    return CategoryOut.model_construct(
+        id=category.id,
+        name=category.name,
+        created_at=category.created_at,
+        updated_at=category.updated_at,
+    )
+
 
-# ---------- DB Dependency ----------
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def product_to_schema(product, category_name) -> ProductOut:
+    return ProductOut.model_construct(
+        id=product.id,
+        name=product.name,
+        stock_qty=product.stock_qty,
+        price=product.price,
+        category_id=product.category_id,
+        category_name=category_name,
+        price_with_tax=product.price * TAX_MULTIPLIER,
+        created_at=product.created_at,
+        updated_at=product.updated_at,
+    )
 
 
 # ---------- CATEGORY ----------
-@router.get("/categories", response_model=List[CategoryOut])
-def read_categories(db: Session = Depends(get_db)):
-    return db.query(Category).all()
+@router.get(
+    "/categories",
+    response_model=None,
+    responses={200: {"model": List[CategoryOut]}},
+)
+async def read_categories(db: Session = Depends(get_db)):
+    def render():
+        # Just the columns CategoryOut needs: light rows, no identity map
+        categories = db.execute(select(*_CATEGORY_COLUMNS)).all()
+        return _categories_adapter.dump_json(
+            [category_to_schema(category) for category in categories]
+        )
+
+    return await cached_list("categories", render)
+
+
+async def save_category_later(values: dict):
+    """
+    Write-behind for create_category(sync=False): runs after the 202 went
+    out, with its own session (the request's one is closed by then).
+    """
+    def save():
+        db = SessionLocal()
+        try:
+            db.execute(insert(Category).values(**values))
+            db.commit()
+        except SQLAlchemyError:
+            db.rollback()
+            logger.exception("Deferred category insert failed: %s", values)
+        finally:
+            db.close()
+
+    await run_in_threadpool(save)
+    await invalidate_lists("categories")
 
 
 @router.post(
     "/categories",
     status_code=status.HTTP_201_CREATED,
-    response_model=CategoryOut
+    response_model=CategoryOut,
+    responses={202: {"description": "Queued (sync=false); written after the response"}},
 )
-def create_category(category: CategoryCreate, db: Session = Depends(get_db),current_user: User = Depends(superuser_required)):
+async def create_category(
+    category: CategoryCreate,
+    background_tasks: BackgroundTasks,
+    sync: bool = True,
+    db: Session = Depends(get_db),current_user: User = Depends(superuser_required)
+):
+    # sync=false: answer right away and commit after the response is sent
+    # (no read-your-writes: the category shows up once the write lands)
+    if not sync:
+        background_tasks.add_task(save_category_later, category.model_dump())
+        return ORJSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={"message": "Category creation queued", "name": category.name},
+        )
+
     db_category = Category(**category.model_dump())
-    db.add(db_category,current_user)
-    db.commit()
-    db.refresh(db_category)
+
+    def save_category():
+        db.add(db_category)
+        db.commit()
+
+    await run_in_threadpool(save_category)
+    await invalidate_lists("categories")
     return db_category
 
 
+@router.post(
+    "/categories/bulk",
+    status_code=status.HTTP_201_CREATED,
+    response_model=None,
+    responses={201: {"model": List[CategoryOut]}},
+)
+async def create_categories_bulk(
+    categories: List[CategoryCreate],
+    db: Session = Depends(get_db),current_user: User = Depends(superuser_required)
+):
+    if not categories:
+        raise HTTPException(status_code=400, detail="No categories given")
+
+    # One executemany INSERT ... RETURNING in one transaction; SQLAlchemy
+    # batches the rows into multi-VALUES statements where the driver allows
+    def save_categories():
+        rows = db.execute(
+            insert(Category).returning(*_CATEGORY_COLUMNS, sort_by_parameter_order=True),
+            [category.model_dump() for category in categories],
+        ).all()
+        db.commit()
+        return rows
+
+    rows = await run_in_threadpool(save_categories)
+    await invalidate_lists("categories")
+    return Response(
+        _categories_adapter.dump_json([category_to_schema(row) for row in rows]),
+        status_code=status.HTTP_201_CREATED,
+        media_type="application/json",
+    )
+
+
 @router.get("/categories/{category_id}", response_model=CategoryOut)
-def read_category(category_id: int, db: Session = Depends(get_db)):
-    category = db.query(Category).filter(Category.id == category_id).first()
+async def read_category(category_id: int, db: Session = Depends(get_db)):
+    category = await run_in_threadpool(
+        lambda: db.query(Category).filter(Category.id == category_id).first()
+    )
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
     return category
@@ -58,43 +259,65 @@ def read_category(category_id: int, db: Session = Depends(get_db)):
 
 
 @router.put("/categories/{category_id}", response_model=CategoryOut)
-def update_category(
+async def update_category(
     category_id: int,
     category: CategoryCreate,
     db: Session = Depends(get_db),current_user: User = Depends(superuser_required)
 ):
-    category=db.query(Category).filter(Category.id==category_id).first()
-    if not category:
+    db_category = await run_in_threadpool(
+        lambda: db.query(Category).filter(Category.id==category_id).first()
+    )
+    if not db_category:
         raise HTTPException(status_code=404, detail="Category not found")
     for key, value in category.model_dump(exclude_unset=True).items():
-        setattr(category, key, value)
+        setattr(db_category, key, value)
 
-    db.commit()
-    db.refresh(category)
-    return {
-        "category": category,
-        "updated_by": current_user
-    }
+    await run_in_threadpool(db.commit)
+    # Product payloads carry the category name too
+    await invalidate_lists("categories", "products")
+    return db_category
 
 
 @router.delete("/categories/{category_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_category(category_id: int, db: Session = Depends(get_db),current_user: User = Depends(superuser_required)):
-    category_id=db.query(Category).filter(Category.id==category_id).first()
-    if not category_id:
+async def delete_category(category_id: int, db: Session = Depends(get_db),current_user: User = Depends(superuser_required)):
+    category = await run_in_threadpool(
+        lambda: db.query(Category).filter(Category.id==category_id).first()
+    )
+    if not category:
         raise HTTPException(status_code=404, detail="Category not found")
 
-    db.delete(category_id)
-    db.commit()
-    return {"message": "Category deleted successfully","deleted_by":current_user}
+    def remove_category():
+        db.delete(category)
+        db.commit()
+
+    await run_in_threadpool(remove_category)
+    # Deleting a category cascades to its products
+    await invalidate_lists("categories", "products")
 
 
 
 
 
 # ---------- PRODUCT ----------
-@router.get("/products", response_model=List[ProductOut])
-def read_products(db: Session = Depends(get_db)):
-    return db.query(Product).all()
+@router.get(
+    "/products",
+    response_model=None,
+    responses={200: {"model": List[ProductOut]}},
+)
+async def read_products(db: Session = Depends(get_db)):
+    def render():
+        # Same for ProductOut (price_with_tax is derived from price); the
+        # category names come from one extra query over the distinct ids
+        products = db.execute(select(*_PRODUCT_COLUMNS)).all()
+        names = category_names(db, (product.category_id for product in products))
+        return _products_adapter.dump_json(
+            [
+                product_to_schema(product, names.get(product.category_id))
+                for product in products
+            ]
+        )
+
+    return await cached_list("products", render)
 
 
 @router.post(
@@ -102,7 +325,7 @@ def read_products(db: Session = Depends(get_db)):
     status_code=status.HTTP_201_CREATED,
     response_model=ProductOut
 )
-def create_product(
+async def create_product(
     product: ProductCreate,
     db: Session = Depends(get_db),current_user: User = Depends(superuser_required)
 ):
@@ -113,49 +336,70 @@ def create_product(
         category_id=product.category_id,
     )
 
-    db.add(db_product,current_user)
-    db.commit()
-    db.refresh(db_product)
-    return db_product
+    def save_product():
+        db.add(db_product)
+        db.commit()
+        return category_names(db, [db_product.category_id])
+
+    names = await run_in_threadpool(save_product)
+    await invalidate_lists("products")
+    return product_to_schema(db_product, names.get(db_product.category_id))
 
 
 
 @router.get("/products/{product_id}", response_model=ProductOut)
-def read_product(product_id: int, db: Session = Depends(get_db)):
-    product = db.query(Product).filter(Product.id == product_id).first()
-    if not product:
+async def read_product(product_id: int, db: Session = Depends(get_db)):
+    row = await run_in_threadpool(
+        lambda: db.execute(
+            select(*_PRODUCT_COLUMNS, Category.name.label("category_name"))
+            .outerjoin(Category, Category.id == Product.category_id)
+            .where(Product.id == product_id)
+        ).first()
+    )
+    if not row:
         raise HTTPException(status_code=404, detail="Product not found")
-    return product
+    return product_to_schema(row, row.category_name)
 
 @router.put("/products/{product_id}", response_model=ProductOut)
-def update_product(
+async def update_product(
     product_id: int,
     product: ProductUpdate,
     db: Session = Depends(get_db),
     current_user: User = Depends(superuser_required)
 ):
-    db_product = db.query(Product).filter(Product.id == product_id).first()
+    db_product = await run_in_threadpool(
+        lambda: db.query(Product).filter(Product.id == product_id).first()
+    )
     if not db_product:
         raise HTTPException(status_code=404, detail="Product not found")
 
     for key, value in product.model_dump(exclude_unset=True).items():
         setattr(db_product, key, value)
 
-    db.commit()
-    db.refresh(db_product)
-    return {db_product,current_user}
+    def save_product():
+        db.commit()
+        return category_names(db, [db_product.category_id])
+
+    names = await run_in_threadpool(save_product)
+    await invalidate_lists("products")
+    return product_to_schema(db_product, names.get(db_product.category_id))
 
 
 
 @router.delete("/products/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_product(product_id: int, db: Session = Depends(get_db),current_user: User = Depends(superuser_required)):
-    product = db.query(Product).filter(Product.id == product_id).first()
+async def delete_product(product_id: int, db: Session = Depends(get_db),current_user: User = Depends(superuser_required)):
+    product = await run_in_threadpool(
+        lambda: db.query(Product).filter(Product.id == product_id).first()
+    )
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    db.delete(product)
-    db.commit()
-    return {"message": "Product deleted successfully","deleted_by":current_user}
+    def remove_product():
+        db.delete(product)
+        db.commit()
+
+    await run_in_threadpool(remove_product)
+    await invalidate_lists("products")
 
 
 
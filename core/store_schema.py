@@ -1,12 +1,21 @@
 from decimal import Decimal
-from pydantic import BaseModel, Field,conint
+from pydantic import BaseModel, ConfigDict, Field, StringConstraints
 from datetime import datetime
-from typing import List
+from typing import Annotated, List
+
+# Constrained field types: each compiles to one pydantic-core schema node.
+# Product names and prices mirror their columns; the 255-character category
+# name limit is an API rule only (Category.name is an unbounded String)
+CategoryName = Annotated[str, StringConstraints(strip_whitespace=True, min_length=1, max_length=255)]
+ProductName = Annotated[str, StringConstraints(strip_whitespace=True, min_length=1, max_length=100)]
+StockQty = Annotated[int, Field(ge=0)]
+Price = Annotated[Decimal, Field(ge=0, max_digits=10, decimal_places=2)]
+Quantity = Annotated[int, Field(gt=0)]  # quantity must be > 0
 
 # ---------- CATEGORY ----------
 
 class CategoryBase(BaseModel):
-    name: str
+    name: CategoryName
 
 
 class CategoryCreate(CategoryBase):
@@ -18,16 +27,15 @@ class CategoryOut(CategoryBase):
     created_at: datetime
     updated_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # ---------- PRODUCT ----------
 
 class ProductBase(BaseModel):
-    name: str
-    stock_qty: int
-    price: Decimal
+    name: ProductName
+    stock_qty: StockQty
+    price: Price
     category_id: int
 
 
@@ -37,32 +45,32 @@ class ProductCreate(ProductBase):
 
 
 class ProductUpdate(BaseModel):
-    name: str | None = None
-    stock_qty: int | None = None
-    price: Decimal | None = None
+    name: ProductName | None = None
+    stock_qty: StockQty | None = None
+    price: Price | None = None
     category_id: int | None = None
 
 
 
 class ProductOut(ProductBase):
     id: int
+    category_name: str | None = None
     price_with_tax: Decimal
     created_at: datetime
     updated_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
         
 # ---------- CARTITEM ---------- 
 
 
 class CartItemCreate(BaseModel):
     product_id: int
-    qty: int = Field(..., gt=0)  # quantity must be > 0
+    qty: Quantity
 
 
 class CartItemUpdate(BaseModel):
-    qty: int = Field(..., gt=0)
+    qty: Quantity
 
 
 class CartItemResponse(BaseModel):
@@ -72,8 +80,7 @@ class CartItemResponse(BaseModel):
     total_price: Decimal
     total_price_with_tax: Decimal
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # ---------- CART ----------
@@ -87,3 +94,5 @@ class CartResponse(BaseModel):
     updated_at: datetime
     items: List[CartItemResponse]
 
+    model_config = ConfigDict(from_attributes=True)
+
@@ -1,15 +1,17 @@
 from getpass import getpass
 
-from core.database import SessionLocal
+from core.database import SessionLocal, init_db
 from core.models import User
 from core.security import hash_password
 
 
 
 def create_superuser():
+    # Works on a fresh database too, without starting the API first
+    init_db()
     db = SessionLocal()
 
-    email = input("Email: ")
+    email = input("Email: ").strip().lower()
     username = input("Username: ")
     password = getpass("Password: ")
 
@@ -23,7 +25,6 @@ def create_superuser():
 
     db.add(user)
     db.commit()
-    db.refresh(user)
 
     print("✅ Superuser created successfully")
 